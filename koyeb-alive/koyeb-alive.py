@@ -1,22 +1,60 @@
 import os
+import time
+import hashlib
+import asyncio
+import aiohttp
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
-import time
+import orjson
 import logging
-from typing import List, Dict, Tuple, Any, Optional
+from typing import List, Dict, Set, Tuple, Any, Optional
 from datetime import datetime, timezone, timedelta
 
 # --- 常量定义 ---
 KOYEB_PROFILE_URL = "https://app.koyeb.com/v1/account/profile"
 REQUEST_TIMEOUT = 30  # 请求超时，单位：秒
+MAX_CONCURRENCY = 10  # 同时验证的账户数上限，避免触发 Koyeb 限流
+REQUEST_RETRIES = 3  # 网络异常或网关错误时的重试次数
+RETRY_BACKOFF_FACTOR = 0.5  # 重试间隔: 0.5s -> 1s -> 2s
+RETRY_STATUS_CODES = (502, 503, 504)  # 仅用于 Koyeb GET 请求
+TG_RETRY_STATUS_CODES = (429,)  # sendMessage 非幂等，只重试限流响应
 BEIJING_TZ = timezone(timedelta(hours=8))
+# Koyeb 请求的公共请求头，挂在会话上，每次请求只需附加 Authorization
+KOYEB_DEFAULT_HEADERS = {
+    "Content-Type": "application/json",
+    "User-Agent": "KoyebAccountStatusChecker/1.0"
+}
+STATUS_CACHE_FILE = os.path.expanduser("~/.cache/koyeb-alive.json")
+STATUS_CACHE_TTL = 600  # 账户状态缓存有效期，单位：秒
+
+# Telegram 配置，启动时读取一次
+_TG_TOKEN = os.getenv("TG_BOT_TOKEN")
+_TG_CHAT = os.getenv("TG_CHAT_ID")
+_TG_URL = f"https://api.telegram.org/bot{_TG_TOKEN}/sendMessage" if _TG_TOKEN else None
+
+# --- HTTP 会话 ---
+# 复用 Telegram 连接，避免每次请求重新进行 DNS/TCP/TLS 握手
+# 仅在连接失败或限流 (429) 时重试，读超时不重试，避免重复推送消息
+_tg_retry = Retry(
+    total=REQUEST_RETRIES,
+    read=0,
+    backoff_factor=RETRY_BACKOFF_FACTOR,
+    status_forcelist=TG_RETRY_STATUS_CODES,
+    allowed_methods=["POST"],
+    respect_retry_after_header=True,
+)
+_tg_session = requests.Session()
+_tg_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=16, max_retries=_tg_retry))
 
 # --- 日志配置 ---
 class BeijingTimeFormatter(logging.Formatter):
     def __init__(self, fmt=None, datefmt=None, style='%'):
         super().__init__(fmt=fmt, datefmt=datefmt, style=style)
+        self.tz = BEIJING_TZ
     def formatTime(self, record, datefmt=None):
-        dt = datetime.fromtimestamp(record.created, BEIJING_TZ)
+        dt = datetime.fromtimestamp(record.created, self.tz)
         if datefmt:
             return dt.strftime(datefmt)
         else:
@@ -43,9 +81,8 @@ def validate_and_load_accounts() -> List[Dict[str, str]]:
         raise ValueError("必须配置 KOYEB_LOGIN 环境变量")
 
     accounts = []
-    lines = koyeb_login_env.strip().split('\n') # 按行分割，并处理空行
-    
-    for line in lines:
+    # 先去掉首尾空行，splitlines() 同时兼容 \n、\r\n 和 \r 换行
+    for line in koyeb_login_env.strip().splitlines():
         line = line.strip()
         if not line or ':' not in line:
             logging.warning(f"⚠️ 跳过无效或空行: {line}")
@@ -68,141 +105,254 @@ def validate_and_load_accounts() -> List[Dict[str, str]]:
 
 # --- Telegram 发送函数 ---
 def send_tg_message(message: str) -> Optional[Dict[str, Any]]:
-    bot_token = os.getenv("TG_BOT_TOKEN")
-    chat_id = os.getenv("TG_CHAT_ID")
-
-    if not bot_token or not chat_id:
+    if not _TG_URL or not _TG_CHAT:
         logging.warning("⚠️ TG_BOT_TOKEN 或 TG_CHAT_ID 未设置，跳过发送 Telegram 消息。")
         return None
 
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
     payload = {
-        "chat_id": chat_id,
+        "chat_id": _TG_CHAT,
         "text": message,
         "parse_mode": "Markdown"
     }
     try:
-        response = requests.post(url, data=payload, timeout=REQUEST_TIMEOUT)
+        response = _tg_session.post(_TG_URL, data=payload, timeout=REQUEST_TIMEOUT)
         response.raise_for_status()
-        return response.json()
+        return orjson.loads(response.content)
     except requests.exceptions.HTTPError as http_err:
         logging.error(f"❌ 发送 Telegram 消息时发生HTTP错误: {http_err}")
         logging.error(f"❌ 响应内容: {http_err.response.text}")
         return None
+    except orjson.JSONDecodeError as e:
+        logging.error(f"❌ 解析 Telegram 响应失败: {e}")
+        return None
     except requests.exceptions.RequestException as e:
         logging.error(f"❌ 发送 Telegram 消息失败: {e}")
         return None
 
+# --- 账户状态缓存 ---
+# 结构: {sha256(email:PAT): [时间戳, 是否成功, 消息]}
+_status_cache: Dict[str, List[Any]] = {}
+# 本次运行中出现过的缓存键，保存时用于清理已移除账户的过期条目
+_seen_cache_keys: Set[str] = set()
+
+def is_valid_cache_entry(entry: Any) -> bool:
+    # 结构应为 [时间戳, 是否成功, 消息]
+    return isinstance(entry, list) and len(entry) == 3 and isinstance(entry[0], (int, float))
+
+def load_status_cache() -> None:
+    """
+    从 STATUS_CACHE_FILE 加载账户状态缓存，文件不存在或损坏时忽略。
+    """
+    try:
+        with open(STATUS_CACHE_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return
+    if isinstance(data, dict):
+        _status_cache.update(data)
+
+def save_status_cache() -> None:
+    """
+    写入账户状态缓存，丢弃本次未出现且已超过 STATUS_CACHE_TTL 的条目。
+    """
+    now = time.time()
+    for key in list(_status_cache):
+        if key in _seen_cache_keys:
+            continue
+        entry = _status_cache[key]
+        if not is_valid_cache_entry(entry) or now - entry[0] >= STATUS_CACHE_TTL:
+            del _status_cache[key]
+    try:
+        os.makedirs(os.path.dirname(STATUS_CACHE_FILE), exist_ok=True)
+        with open(STATUS_CACHE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(_status_cache, f, ensure_ascii=False)
+    except OSError as e:
+        logging.warning(f"⚠️ 写入账户状态缓存失败: {e}")
+
+def stale_or(cached: Optional[List[Any]], fallback: Tuple[bool, str]) -> Tuple[bool, str, bool]:
+    """
+    网络异常时优先返回上一次的缓存结果，并标注为过期缓存。
+    返回 (是否成功, 消息, 是否为过期缓存)。
+    """
+    if cached:
+        return cached[1], f"{cached[2]} (缓存, 已过期)", True
+    return fallback[0], fallback[1], False
+
 # --- 账户验证函数 ---
-def verify_koyeb_account_status(email: str, pat: str) -> Tuple[bool, str]:
+def check_profile(email: str, profile_data: Dict[str, Any]) -> Tuple[bool, str]:
+    """
+    根据 /v1/account/profile 返回的数据判断账户状态。
+    """
+    user_info = profile_data.get('user', {})
+    returned_email = user_info.get('email', '')
+    flags = user_info.get('flags', [])
+    email_validated = user_info.get('email_validated', False)
+    
+    # 严格验证逻辑
+    if returned_email.lower() != email.lower():
+        return False, f"验证失败：API返回邮箱({returned_email})与提供邮箱不匹配。"
+    
+    is_active = "ACTIVE" in flags
+    
+    if is_active and email_validated:
+        return True, "活跃且邮箱已验证"
+    elif not is_active:
+        return False, f"原因: 非活跃 (Flags: {', '.join(flags)})"
+    elif not email_validated:
+        return False, "原因: 邮箱未验证"
+    else:
+        return False, f"原因: 未知账户: {user_info}"
+
+async def fetch_profile(session: aiohttp.ClientSession, headers: Dict[str, str]) -> Tuple[int, bytes]:
+    """
+    请求 /v1/account/profile 端点，返回 (状态码, 原始响应内容)。
+    超时、连接异常或 502/503/504 时按指数退避重试，401/403 等错误不重试。
+    """
+    for attempt in range(REQUEST_RETRIES + 1):
+        try:
+            async with session.get(
+                KOYEB_PROFILE_URL,
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+            ) as response:
+                if response.status not in RETRY_STATUS_CODES or attempt == REQUEST_RETRIES:
+                    return response.status, await response.read()
+        except (asyncio.TimeoutError, aiohttp.ClientConnectionError):
+            if attempt == REQUEST_RETRIES:
+                raise
+        await asyncio.sleep(RETRY_BACKOFF_FACTOR * 2 ** attempt)
+    # 最后一次尝试必定返回或抛出异常
+    raise AssertionError("unreachable")
+
+async def verify_koyeb_account_status(session: aiohttp.ClientSession, email: str, pat: str) -> Tuple[bool, str, bool]:
     """
     使用 PAT 调用 /v1/account/profile 端点，并验证账户状态。
+    STATUS_CACHE_TTL 内已验证过的账户直接返回缓存结果。
+    返回 (是否成功, 消息, 是否为过期缓存)，过期缓存的结果不计入成功数。
     """
     if not email or not pat:
-        return False, "邮箱或个人访问令牌 (PAT) 为空"
+        return False, "邮箱或个人访问令牌 (PAT) 为空", False
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {pat}", 
-        "User-Agent": "KoyebAccountStatusChecker/1.0"
-    }
+    cache_key = hashlib.sha256(f"{email.lower()}:{pat}".encode()).hexdigest()
+    _seen_cache_keys.add(cache_key)
+    cached = _status_cache.get(cache_key)
+    # 忽略格式不正确的缓存条目
+    if not is_valid_cache_entry(cached):
+        cached = None
+    if cached and time.time() - cached[0] < STATUS_CACHE_TTL:
+        return cached[1], f"{cached[2]} (缓存)", False
+
+    headers = {"Authorization": f"Bearer {pat}"}
 
     try:
-        response = requests.get(
-            KOYEB_PROFILE_URL,  
-            headers=headers,  
-            timeout=REQUEST_TIMEOUT,
-        )
-        
+        status, body = await fetch_profile(session, headers)
+
         # 检查 HTTP 状态码
-        if response.status_code == 401 or response.status_code == 403:
-             return False, "验证失败：PAT 无效或已过期。"
-        
-        response.raise_for_status() # 抛出非 2xx 状态码错误
-
-        # 解析并验证返回的 JSON 数据
-        profile_data = response.json() 
-        user_info = profile_data.get('user', {})
-        returned_email = user_info.get('email', '')
-        flags = user_info.get('flags', [])
-        email_validated = user_info.get('email_validated', False)
-        
-        # 严格验证逻辑
-        if returned_email.lower() != email.lower():
-            return False, f"验证失败：API返回邮箱({returned_email})与提供邮箱不匹配。"
-        
-        is_active = "ACTIVE" in flags
-        
-        if is_active and email_validated:
-            return True, "活跃且邮箱已验证"
-        elif not is_active:
-            return False, f"原因: 非活跃 (Flags: {', '.join(flags)})"
-        elif not email_validated:
-            return False, "原因: 邮箱未验证"
-        else:
-            return False, f"原因: 未知账户: {user_info}"
+        if status == 401 or status == 403:
+            return False, "验证失败：PAT 无效或已过期。", False
 
+        # 非 2xx 状态码错误
+        if status >= 400:
+            error_text = body.decode('utf-8', errors='replace')
+            try:
+                error_data = orjson.loads(body)
+                error_message = error_data.get('error', error_text)
+                return False, f"原因: API错误 (状态码 {status}): {error_message}", False
+            except orjson.JSONDecodeError:
+                return False, f"原因: HTTP错误 (状态码 {status}): {error_text}", False
 
-    except requests.exceptions.HTTPError as http_err:
-        try:
-            error_data = http_err.response.json()
-            error_message = error_data.get('error', http_err.response.text)
-            return False, f"原因: API错误 (状态码 {http_err.response.status_code}): {error_message}"
-        except json.JSONDecodeError:
-            return False, f"原因: HTTP错误 (状态码 {http_err.response.status_code}): {http_err.response.text}"
-    except requests.exceptions.Timeout:
-        return False, "原因: 请求超时"
-    except requests.exceptions.RequestException as e:
-        return False, f"原因: 网络请求异常: {e}"
+        # 解析返回的 JSON 数据
+        profile_data = orjson.loads(body)
+
+        # 验证返回的 JSON 数据，并写入缓存
+        success, message = check_profile(email, profile_data)
+        _status_cache[cache_key] = [time.time(), success, message]
+        return success, message, False
+
+    except asyncio.TimeoutError:
+        return stale_or(cached, (False, "原因: 请求超时"))
+    except aiohttp.ClientError as e:
+        return stale_or(cached, (False, f"原因: 网络请求异常: {e}"))
     except Exception as e:
-        return False, f"原因: 处理响应时发生异常: {e}"
-        
-def main():
+        return False, f"原因: 处理响应时发生异常: {e}", False
+
+async def process_account(
+    session: aiohttp.ClientSession,
+    semaphore: asyncio.Semaphore,
+    index: int,
+    total_accounts: int,
+    account: Dict[str, str],
+) -> Tuple[bool, List[str]]:
+    """
+    验证单个账户，返回 (是否成功, 报告中该账户的各行文本)。
+    基于过期缓存的结果不视为成功。
+    """
+    email = account.get('email', '').strip()
+    pat = account.get('pat', '')
+
+    if not email or not pat:
+        logging.warning(f"⚠️ 第 {index}/{total_accounts} 个账户信息不完整，已跳过")
+        return False, ["账户: 未提供邮箱", "状态: ❌ 信息不完整"]
+
+    async with semaphore:
+        logging.info(f"🚀 正在处理第 {index}/{total_accounts} 个账户: {email}")
+        # 调用验证函数
+        success, message, stale = await verify_koyeb_account_status(session, email, pat)
+
+    # 过期缓存只用于展示，本次未能实际验证，不计为成功
+    if success and stale:
+        return False, [f"账户: `{email}`", f"状态: ⚠️ 未能验证，沿用 {message}"]
+    if success:
+        return True, [f"账户: `{email}`", f"状态: ✅ {message}"]
+    return False, [f"账户: `{email}`", "状态: ❌ 验证失败", f"  {message}"]
+
+async def main():
     try:
         koyeb_accounts = validate_and_load_accounts()
+        load_status_cache()
         
-        results = []
+        out: List[str] = []
         current_time_dt = datetime.now(BEIJING_TZ)
         current_time = current_time_dt.strftime("%Y-%m-%d %H:%M:%S")
         total_accounts = len(koyeb_accounts)
         success_count = 0
 
-        for index, account in enumerate(koyeb_accounts, 1):
-            email = account.get('email', '').strip()
-            pat = account.get('pat', '')
+        # 所有账户并发验证，信号量限制同时进行的请求数
+        semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+        connector = aiohttp.TCPConnector(limit=MAX_CONCURRENCY)
+        async with aiohttp.ClientSession(connector=connector, headers=KOYEB_DEFAULT_HEADERS) as session:
+            tasks = [
+                process_account(session, semaphore, index, total_accounts, account)
+                for index, account in enumerate(koyeb_accounts, 1)
+            ]
+            outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+        save_status_cache()
 
-            if not email or not pat:
-                logging.warning(f"⚠️ 第 {index}/{total_accounts} 个账户信息不完整，已跳过")
-                results.append(f"账户: 未提供邮箱\n状态: ❌ 信息不完整\n")
+        for account, outcome in zip(koyeb_accounts, outcomes):
+            if isinstance(outcome, Exception):
+                email = account.get('email', '').strip()
+                logging.error(f"❌ 处理账户 {email} 时发生未知异常: {outcome}")
+                out.append(f"账户: `{email}`")
+                out.append("状态: ❌ 验证失败")
+                out.append(f"  执行时发生未知异常 - {outcome}")
+                out.append("")
                 continue
 
-            logging.info(f"🚀 正在处理第 {index}/{total_accounts} 个账户: {email}")
-            time.sleep(10)
+            success, account_lines = outcome
+            if success:
+                success_count += 1
+            out.extend(account_lines)
+            out.append("")
 
-            try:
-                # 调用验证函数
-                success, message = verify_koyeb_account_status(email, pat)
-                if success:
-                    status_line = f"状态: ✅ {message}"
-                    success_count += 1
-                else:
-                    status_line = f"状态: ❌ 验证失败\n  {message}"
-            except Exception as e:
-                logging.error(f"❌ 处理账户 {email} 时发生未知异常: {e}")
-                status_line = f"状态: ❌ 验证失败\n  执行时发生未知异常 - {e}"
-
-            results.append(f"账户: `{email}`\n{status_line}\n")
-
-        summary = f"📊 总计: {total_accounts} 个账户\n✅ 成功: {success_count} 个 | ❌ 失败: {total_accounts - success_count} 个"
-        report_body = "".join(results)
-        tg_message = (
-            f"🤖 *Koyeb 账户状态报告* 🤖\n"
-            f"=====================\n"
-            f"⏰ 日期: {current_time}\n"
-            f"{summary}\n"
-            f"---------------------------\n"
-            f"{report_body}"
-        )
+        header = [
+            "🤖 *Koyeb 账户状态报告* 🤖",
+            "=====================",
+            f"⏰ 日期: {current_time}",
+            f"📊 总计: {total_accounts} 个账户",
+            f"✅ 成功: {success_count} 个 | ❌ 失败: {total_accounts - success_count} 个",
+            "---------------------------",
+        ]
+        tg_message = "\n".join(header + out)
 
         logging.info("📊 --- 报告预览 ---\n" + tg_message)
         send_tg_message(tg_message)
@@ -221,4 +371,4 @@ def main():
         sys.exit(1)
             
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
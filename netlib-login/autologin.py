@@ -1,52 +1,107 @@
 import os
-import time
+import re
+import asyncio
 import requests
-from datetime import datetime, timedelta
-from playwright.sync_api import sync_playwright
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from datetime import datetime, timezone, timedelta
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 
 # -------------------------------
+BEIJING_TZ = timezone(timedelta(hours=8))
+REQUEST_RETRIES = 3  # 网络异常或限流时的重试次数
+RETRY_BACKOFF_FACTOR = 0.5  # 重试间隔: 0.5s -> 1s -> 2s
+TG_RETRY_STATUS_CODES = (429,)  # sendMessage 非幂等，只重试限流响应
 log_buffer = []
 
+# Telegram 配置，启动时读取一次
+_TG_TOKEN = os.getenv("TG_BOT_TOKEN")
+_TG_CHAT = os.getenv("TG_CHAT_ID")
+_TG_URL = f"https://api.telegram.org/bot{_TG_TOKEN}/sendMessage" if _TG_TOKEN else None
+
+# 复用 Telegram 连接，分段推送时无需重复握手
+# 仅在连接失败或限流 (429) 时重试并遵循 Retry-After，读超时不重试，避免重复推送
+_tg_retry = Retry(
+    total=REQUEST_RETRIES,
+    read=0,
+    backoff_factor=RETRY_BACKOFF_FACTOR,
+    status_forcelist=TG_RETRY_STATUS_CODES,
+    allowed_methods=["GET"],
+    respect_retry_after_header=True,
+)
+_tg_session = requests.Session()
+_tg_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=16, max_retries=_tg_retry))
+
 def log(msg):
     print(msg)
     log_buffer.append(msg)
 # -------------------------------
 
+# Telegram 推送分段上限 (UTF-8 字节)，低于 Telegram 4096 字符限制
+TG_CHUNK_BYTES = 3900
+
+def build_tg_chunks(lines):
+    """
+    按行组装推送分段，每段 UTF-8 长度不超过 TG_CHUNK_BYTES，避免在字符串上反复切片。
+    """
+    chunks = []
+    current = []
+    current_bytes = 0
+    for line in lines:
+        data = line.encode("utf-8")
+        if len(data) <= TG_CHUNK_BYTES:
+            pieces = [(line, len(data))]
+        else:
+            # 单行超长时按字节切分，切点回退到 UTF-8 字符起始字节，避免截断字符
+            pieces = []
+            start = 0
+            while start < len(data):
+                end = min(start + TG_CHUNK_BYTES, len(data))
+                while end < len(data) and data[end] & 0xC0 == 0x80:
+                    end -= 1
+                piece_bytes = data[start:end]
+                pieces.append((piece_bytes.decode("utf-8"), len(piece_bytes)))
+                start = end
+        for piece, size in pieces:
+            # 非首行需额外计入换行符
+            if current and current_bytes + 1 + size > TG_CHUNK_BYTES:
+                chunks.append("\n".join(current))
+                current = []
+                current_bytes = 0
+            current_bytes += size + (1 if current else 0)
+            current.append(piece)
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
 # Telegram 推送函数
 def send_tg_log():
-    token = os.getenv("TG_BOT_TOKEN")
-    chat_id = os.getenv("TG_CHAT_ID")
-    if not token or not chat_id:
+    if not _TG_URL or not _TG_CHAT:
         print("⚠️ Telegram 未配置，跳过推送")
         return
 
-    utc_now = datetime.utcnow()
-    beijing_now = utc_now + timedelta(hours=8)
-    now_str = beijing_now.strftime("%Y-%m-%d %H:%M:%S") + " UTC+8"
+    now_str = datetime.now(BEIJING_TZ).strftime("%Y-%m-%d %H:%M:%S") + " UTC+8"
 
-    final_msg = f"📌 Netlib 保活执行日志\n🕒 {now_str}\n\n" + "\n".join(log_buffer)
+    chunks = build_tg_chunks(["📌 Netlib 保活执行日志", f"🕒 {now_str}", "", *log_buffer])
 
-    for i in range(0, len(final_msg), 3900):
-        chunk = final_msg[i:i+3900]
+    params = {"chat_id": _TG_CHAT, "text": ""}
+    for n, chunk in enumerate(chunks, 1):
+        params["text"] = chunk
         try:
-            resp = requests.get(
-                f"https://api.telegram.org/bot{token}/sendMessage",
-                params={"chat_id": chat_id, "text": chunk},
-                timeout=10
-            )
+            resp = _tg_session.get(_TG_URL, params=params, timeout=10)
             if resp.status_code == 200:
-                print(f"✅ Telegram 推送成功 [{i//3900 + 1}]")
+                print(f"✅ Telegram 推送成功 [{n}]")
             else:
-                print(f"⚠️ Telegram 推送失败 [{i//3900 + 1}]: HTTP {resp.status_code}, 响应: {resp.text}")
+                print(f"⚠️ Telegram 推送失败 [{n}]: HTTP {resp.status_code}, 响应: {resp.text}")
         except Exception as e:
-            print(f"⚠️ Telegram 推送异常 [{i//3900 + 1}]: {e}")
+            print(f"⚠️ Telegram 推送异常 [{n}]: {e}")
 
 # 从环境变量解析多个账号, 格式为多行，每行: username:password
 accounts_env = os.environ.get("NETLIB_ACCOUNTS", "")
 accounts = []
 
-# 使用换行符分割，处理可能的 \r\n 或 \n
-for item in accounts_env.strip().split('\n'):
+# 使用 splitlines() 按行分割，兼容 \n、\r\n 和 \r
+for item in accounts_env.strip().splitlines():
     item = item.strip()
     if item:
         try:
@@ -61,63 +116,84 @@ fail_msgs = [
     "Not connected to server.",
     "Error with the login: login size should be between 2 and 50 (currently: 1)"
 ]
+# 合并为单个正则，一次扫描即可匹配所有失败消息
+FAIL_RE = re.compile("|".join(re.escape(m) for m in fail_msgs))
+
+# 登录只需要 HTML 和接口请求，其余静态资源直接拦截
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media", "stylesheet"}
 
-def login_account(playwright, USER, PWD):
+async def block_static_resources(route):
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+async def login_account(browser, USER, PWD):
     log(f"🚀 开始登录账号: {USER}")
+    context = None
     try:
-        # 使用 headless=True (无头模式)
-        browser = playwright.chromium.launch(headless=True)
-        context = browser.new_context()
-        page = context.new_page()
-
-        page.goto("https://www.netlib.re/")
-        time.sleep(5)
-
-        page.get_by_text("Login").click()
-        time.sleep(2)
-        page.get_by_role("textbox", name="Username").fill(USER)
-        time.sleep(2)
-        page.get_by_role("textbox", name="Password").fill(PWD)
-        time.sleep(2)
-        page.get_by_role("button", name="Validate").click()
-        page.wait_for_load_state("networkidle")
-        time.sleep(2)
+        # 每个账号使用独立的 BrowserContext，共享同一个浏览器进程
+        context = await browser.new_context()
+        await context.route("**/*", block_static_resources)
+        page = await context.new_page()
+
+        await page.goto("https://www.netlib.re/")
+        await page.wait_for_load_state("domcontentloaded")
+
+        # click()/fill() 会自动等待元素可操作，无需固定延时
+        await page.get_by_text("Login").click()
+        await page.get_by_role("textbox", name="Username").fill(USER)
+        await page.get_by_role("textbox", name="Password").fill(PWD)
+        await page.get_by_role("button", name="Validate").click()
+        await page.wait_for_load_state("networkidle")
 
         # 检查是否登录成功
         success_text = "You are the exclusive owner of the following domains."
-        if page.query_selector(f"text={success_text}"):
+        try:
+            await page.wait_for_selector(f"text={success_text}", timeout=10_000)
             log(f"✅ 账号 {USER} 登录成功")
-            time.sleep(5)
-        else:
-            # 检查是否有预设的失败消息
-            failed_msg = None
-            for msg in fail_msgs:
-                # 使用 page.inner_text() 或其他方式检查页面内容
-                if page.locator("body").inner_text().find(msg) != -1:
-                    failed_msg = msg
-                    break
-            
+        except PlaywrightTimeoutError:
+            # 检查是否有预设的失败消息，页面内容只读取一次
+            body_text = await page.locator("body").inner_text()
+            m = FAIL_RE.search(body_text)
+            failed_msg = m.group(0) if m else None
+
             if failed_msg:
                 log(f"❌ 账号 {USER} 登录失败: {failed_msg}")
             else:
                 log(f"❌ 账号 {USER} 登录失败: 未知错误 (当前URL: {page.url})")
 
-        context.close()
-        browser.close()
-
     except Exception as e:
         log(f"❌ 账号 {USER} 登录异常: {e}")
-
-def run():
+    finally:
+        # 只关闭本账号的 Context，浏览器由 run() 统一关闭
+        if context is not None:
+            try:
+                await context.close()
+            except Exception as e:
+                log(f"⚠️ 账号 {USER} 关闭浏览器上下文失败: {e}")
+
+async def run():
     if not accounts:
         log("⚠️ 未找到任何账号配置，请检查 NETLIB_ACCOUNTS 环境变量。")
         return
 
-    with sync_playwright() as playwright:
-        for acc in accounts:
-            login_account(playwright, acc["username"], acc["password"])
-            time.sleep(2)
+    try:
+        async with async_playwright() as playwright:
+            # 使用 headless=True (无头模式)，所有账号并发登录
+            browser = await playwright.chromium.launch(headless=True)
+            try:
+                await asyncio.gather(*(
+                    login_account(browser, acc["username"], acc["password"])
+                    for acc in accounts
+                ))
+            finally:
+                await browser.close()
+    except Exception as e:
+        log(f"❌ 浏览器运行异常: {e}")
 
 if __name__ == "__main__":
-    run()
-    send_tg_log()  # 发送日志
+    try:
+        asyncio.run(run())
+    finally:
+        send_tg_log()  # 无论登录流程是否异常都发送日志